@@ -1,16 +1,33 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import os
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import List
-import shutil
 
-from models import ChatMessage, ChatResponse, UploadResponse
+from models import ChatMessage, ChatResponse, UploadResponse, DeleteDocumentsRequest, DeleteDocumentsResponse
 from rag_service import RAGService
 from pdf_processor import PDFProcessor
 
+rag_service: RAGService = None
+pdf_processor: PDFProcessor = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Services are built at startup rather than import time, so PDF worker
+    # processes that re-import this module do not open Chroma or load models
+    global rag_service, pdf_processor
+    rag_service = RAGService()
+    pdf_processor = PDFProcessor()
+    yield
+    pdf_processor.close()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="RAG PDF System", description="RAG system for PDF documents using Ollama")
+app = FastAPI(title="RAG PDF System", description="RAG system for PDF documents using Ollama", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -21,10 +38,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-rag_service = RAGService()
-pdf_processor = PDFProcessor()
-
 # Create uploads directory
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -36,15 +49,12 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
+def health_check():
     """Health check endpoint"""
-    try:
-        # Test Ollama connection
-        import requests
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        ollama_status = "connected" if response.status_code == 200 else "disconnected"
-    except:
-        ollama_status = "disconnected"
+    # Plain def: FastAPI runs it in the threadpool, so the blocking probe never stalls the event loop
+    # Test Ollama connection through the shared client session
+    ollama_connected = rag_service.ollama_client._check_ollama_connection()
+    ollama_status = "connected" if ollama_connected else "disconnected"
 
     return {
         "status": "healthy",
@@ -53,30 +63,33 @@ async def health_check():
     }
 
 
+def _process_pdf(pdf_content: bytes, filename: str) -> int:
+    # Extract text from PDF, page by page
+    pages = pdf_processor.extract_text_from_pdf(pdf_content)
+
+    # Create chunks
+    chunks = pdf_processor.chunk_text(pages, filename)
+
+    # Add to vector database
+    return rag_service.add_documents(chunks)
+
+
 @app.post("/upload", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload and process PDF file"""
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
     try:
-        # Save uploaded file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Read and process PDF
-        with open(file_path, "rb") as pdf_file:
-            pdf_content = pdf_file.read()
-
-        # Extract text from PDF
-        text = pdf_processor.extract_text_from_pdf(pdf_content)
+        # Read the upload once and process it from memory
+        pdf_content = await file.read()
 
-        # Create chunks
-        chunks = pdf_processor.chunk_text(text, file.filename)
+        # Keep a copy on disk, written after the response is sent
+        file_path = os.path.join(UPLOAD_DIR, file.filename)
+        background_tasks.add_task(Path(file_path).write_bytes, pdf_content)
 
-        # Add to vector database
-        chunks_created = rag_service.add_documents(chunks)
+        # Parsing and embedding block, so run them off the event loop
+        chunks_created = await run_in_threadpool(_process_pdf, pdf_content, file.filename)
 
         return UploadResponse(
             message="PDF uploaded and processed successfully",
@@ -89,7 +102,7 @@ async def upload_pdf(file: UploadFile = File(...)):
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(chat_message: ChatMessage):
+def chat(chat_message: ChatMessage):
     """Chat with the RAG system"""
     try:
         result = rag_service.chat_with_rag(
@@ -103,15 +116,27 @@ async def chat(chat_message: ChatMessage):
         raise HTTPException(status_code=500, detail=f"Error in chat: {str(e)}")
 
 
+@app.post("/chat/stream")
+async def chat_stream(chat_message: ChatMessage):
+    """Chat with the RAG system, streaming the answer as server-sent events"""
+    return StreamingResponse(
+        rag_service.chat_with_rag_stream(
+            message=chat_message.message,
+            session_id=chat_message.session_id
+        ),
+        media_type="text/event-stream"
+    )
+
+
 @app.get("/sessions/{session_id}/history")
-async def get_chat_history(session_id: str):
+def get_chat_history(session_id: str):
     """Get chat history for a session"""
     history = rag_service.get_chat_history(session_id)
     return {"session_id": session_id, "messages": history}
 
 
 @app.delete("/sessions/{session_id}")
-async def clear_chat_history(session_id: str):
+def clear_chat_history(session_id: str):
     """Clear chat history for a session"""
     if session_id in rag_service.chat_sessions:
         del rag_service.chat_sessions[session_id]
@@ -119,11 +144,11 @@ async def clear_chat_history(session_id: str):
 
 
 @app.get("/documents")
-async def list_documents():
+def list_documents():
     """List all uploaded documents"""
     try:
         # Get all documents from ChromaDB
-        results = rag_service.collection.get()
+        results = rag_service.collection.get(include=["metadatas"])
 
         # Extract unique filenames
         filenames = set()
@@ -138,7 +163,36 @@ async def list_documents():
         raise HTTPException(status_code=500, detail=f"Error listing documents: {str(e)}")
 
 
+@app.post("/documents/delete", response_model=DeleteDocumentsResponse)
+async def delete_documents(request: DeleteDocumentsRequest):
+    """Delete several documents and their chunks in one call"""
+    try:
+        chunks_deleted = await run_in_threadpool(rag_service.delete_documents, request.filenames)
+
+        return DeleteDocumentsResponse(
+            message="Documents deleted successfully",
+            filenames=request.filenames,
+            chunks_deleted=chunks_deleted
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting documents: {str(e)}")
+
+
 if __name__ == "__main__":
+    import sys
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Each worker holds its own RAGService (chat sessions, FAISS index), so more
+    # than one worker needs shared state such as Chroma in server mode
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+
+    uvicorn.run(
+        # Multiple workers must import the app themselves; one worker reuses this module
+        "fastAPI:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
\ No newline at end of file
@@ -15,6 +15,14 @@ class UploadResponse(BaseModel):
     filename: str
     chunks_created: int
 
+class DeleteDocumentsRequest(BaseModel):
+    filenames: List[str]
+
+class DeleteDocumentsResponse(BaseModel):
+    message: str
+    filenames: List[str]
+    chunks_deleted: int
+
 class DocumentChunk(BaseModel):
     content: str
     metadata: dict
@@ -1,59 +1,109 @@
-import PyPDF2
+import pypdfium2 as pdfium
+import multiprocessing
+import os
 import re
-from typing import List
-from io import BytesIO
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# PDFium must not be called from several threads at once, even on different documents;
+# uploads are processed in the server's threadpool, so in-process calls are serialized
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _extract_page_range(pdf_content: bytes, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) from a freshly opened document"""
+    pdf = pdfium.PdfDocument(pdf_content)
+    try:
+        page_texts = []
+        for page_num in range(start, stop):
+            page = pdf[page_num]
+            text_page = page.get_textpage()
+            page_texts.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+        return page_texts
+    finally:
+        pdf.close()
 
 
 class PDFProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 parallel_page_threshold: int = None, max_workers: int = None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # PDFium is not thread-safe, so very large documents can be split across processes.
+        # Spawning workers costs seconds while serial extraction runs at thousands of pages
+        # per second, so this is off unless a threshold is given
+        self.parallel_page_threshold = parallel_page_threshold
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
-    def extract_text_from_pdf(self, pdf_content: bytes) -> str:
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Return the worker pool, starting it on first use so later uploads reuse it"""
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawned workers start clean instead of forking a process with live server threads
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
 
+    def close(self):
+        """Shut down the worker pool, if one was started"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def extract_text_from_pdf(self, pdf_content: bytes) -> List[Tuple[int, str]]:
+        """Return (page_index, text) for every page, page_index starting at 0"""
         try:
-            pdf_file = BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_content)
+                try:
+                    page_count = len(pdf)
+                finally:
+                    pdf.close()
 
-            text = ""
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text += f"\n--- Page {page_num + 1} ---\n{page_text}"
+            workers = 1
+            if self.parallel_page_threshold:
+                workers = min(self.max_workers, page_count // self.parallel_page_threshold)
+            if workers <= 1:
+                with _PDFIUM_LOCK:
+                    page_texts = _extract_page_range(pdf_content, 0, page_count)
+            else:
+                step = -(-page_count // workers)
+                starts = list(range(0, page_count, step))
+                stops = [min(start + step, page_count) for start in starts]
+                results = self._get_executor().map(_extract_page_range, [pdf_content] * len(starts), starts, stops)
+                page_texts = [text for page_range in results for text in page_range]
 
-            return text
+            return list(enumerate(page_texts))
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
 
     def clean_text(self, text: str) -> str:
         """Clean and normalize text"""
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         text = text.strip()
         return text
 
-    def chunk_text(self, text: str, filename: str) -> List[dict]:
-        """Split text into chunks with metadata"""
-        clean_text = self.clean_text(text)
+    def chunk_text(self, pages: List[Tuple[int, str]], filename: str) -> List[dict]:
+        """Split extracted pages into chunks with metadata"""
         chunks = []
 
-        # Split by pages first
-        pages = clean_text.split('--- Page')
-
-        for page_idx, page_content in enumerate(pages):
-            if not page_content.strip():
+        for page_num, page_text in pages:
+            page_content = self.clean_text(page_text)
+            if not page_content:
                 continue
 
-            page_num = page_idx
-            if '---' in page_content:
-                try:
-                    page_num = int(page_content.split('---')[0].strip()) - 1
-                    page_content = page_content.split('---', 1)[1] if '---' in page_content else page_content
-                except:
-                    pass
-
             # Further chunk if page is too long
             if len(page_content) <= self.chunk_size:
                 chunks.append({
-                    'content': page_content.strip(),
+                    'content': page_content,
                     'metadata': {
                         'filename': filename,
                         'page': page_num,
@@ -61,21 +111,45 @@ class PDFProcessor:
                     }
                 })
             else:
-                # Split long pages into smaller chunks
-                words = page_content.split()
-                for i in range(0, len(words), self.chunk_size // 10):  # Rough word-based chunking
-                    chunk_words = words[i:i + self.chunk_size // 10]
-                    chunk_content = ' '.join(chunk_words)
-
-                    if chunk_content.strip():
-                        chunks.append({
-                            'content': chunk_content.strip(),
-                            'metadata': {
-                                'filename': filename,
-                                'page': page_num,
-                                'chunk_id': len(chunks),
-                                'sub_chunk': i // (self.chunk_size // 10)
-                            }
-                        })
-
-        return chunks
\ No newline at end of file
+                # Split long pages into overlapping windows
+                for sub_chunk, chunk_content in enumerate(self._split_page(page_content)):
+                    chunks.append({
+                        'content': chunk_content,
+                        'metadata': {
+                            'filename': filename,
+                            'page': page_num,
+                            'chunk_id': len(chunks),
+                            'sub_chunk': sub_chunk
+                        }
+                    })
+
+        return chunks
+
+    def _split_page(self, text: str) -> List[str]:
+        """Split text into windows of at most chunk_size characters on word
+        boundaries, each starting about chunk_overlap characters before the
+        previous one ended"""
+        words = text.split()
+        pieces = []
+        start = 0
+
+        while start < len(words):
+            end = start
+            length = len(words[start])
+            while end + 1 < len(words) and length + 1 + len(words[end + 1]) <= self.chunk_size:
+                end += 1
+                length += 1 + len(words[end])
+            pieces.append(' '.join(words[start:end + 1]))
+
+            if end + 1 >= len(words):
+                break
+
+            # Step back over trailing words to carry chunk_overlap characters forward
+            next_start = end + 1
+            overlap = 0
+            while next_start - 1 > start and overlap + len(words[next_start - 1]) < self.chunk_overlap:
+                next_start -= 1
+                overlap += len(words[next_start]) + 1
+            start = next_start
+
+        return pieces
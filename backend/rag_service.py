@@ -1,12 +1,20 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import hashlib
 import chromadb
 from chromadb.config import Settings
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import os
+import threading
 import time
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from models import DocumentChunk
+from vector_index import FaissIndex, normalize_embeddings
 
 
 class OllamaClient:
@@ -14,23 +22,52 @@ class OllamaClient:
         self.base_url = base_url
         self.max_retries = 3
         self.retry_delay = 2
+        self.embed_batch_size = 64
+        # Matches the number of requests Ollama serves at once (OLLAMA_NUM_PARALLEL);
+        # Ollama reads 0 as "auto", so that falls back to the default
+        self.max_parallel_requests = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "4")) or 4)
+        # Successful /api/tags responses are reused for this many seconds
+        self._check_ttl = 30
+        self._check_cache = {}
+
+        # Keep-alive connections shared by every call, including the embedding worker threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=20,
+            pool_maxsize=20,
+            max_retries=Retry(total=3, backoff_factor=0.5)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The availability probe must fail fast when Ollama is down, so it gets no retries;
+        # requests picks the longest matching mount prefix
+        self.session.mount(f"{self.base_url}/api/tags", HTTPAdapter(max_retries=0))
+
+    def _get_available_models(self) -> Optional[List[Dict]]:
+        """Return the model list from /api/tags, or None if Ollama is unreachable"""
+        now = time.monotonic()
+        if now - self._check_cache.get("timestamp", float("-inf")) < self._check_ttl:
+            return self._check_cache["models"]
 
-    def _check_ollama_connection(self):
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+            if response.status_code != 200:
+                return None
+            models = response.json().get("models", [])
         except:
-            return False
+            return None
+
+        self._check_cache = {"timestamp": now, "models": models}
+        return models
+
+    def _check_ollama_connection(self):
+        return self._get_available_models() is not None
 
     def _check_model_availability(self, model_name: str) -> bool:
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return any(model_name in model.get("name", "") for model in models)
-            return False
-        except:
+        models = self._get_available_models()
+        if models is None:
             return False
+        return any(model_name in model.get("name", "") for model in models)
 
     def generate_embeddings(self, text: str) -> List[float]:
         if not self._check_ollama_connection():
@@ -41,7 +78,7 @@ class OllamaClient:
 
         for attempt in range(self.max_retries):
             try:
-                response = requests.post(
+                response = self.session.post(
                     f"{self.base_url}/api/embeddings",
                     json={
                         "model": "nomic-embed-text",
@@ -58,26 +95,56 @@ class OllamaClient:
 
         raise Exception("Failed to generate embeddings")
 
-    def chat_completion(self, messages: List[Dict], context: str = "") -> str:
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts with a single /api/embed request"""
+        if not self._check_ollama_connection():
+            raise Exception("Ollama service is not running. Please start Ollama with 'ollama serve'")
+
+        if not self._check_model_availability("nomic-embed-text"):
+            raise Exception("Model 'nomic-embed-text' not found. Please run 'ollama pull nomic-embed-text'")
+
+        for attempt in range(self.max_retries):
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/embed",
+                    json={
+                        "model": "nomic-embed-text",
+                        "input": texts
+                    },
+                    timeout=120
+                )
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            except requests.exceptions.RequestException as e:
+                if attempt == self.max_retries - 1:
+                    raise Exception(f"Error generating embeddings after {self.max_retries} attempts: {str(e)}")
+                time.sleep(self.retry_delay)
+
+        raise Exception("Failed to generate embeddings")
+
+    def _build_prompt(self, messages: List[Dict], context: str) -> str:
         if not self._check_ollama_connection():
             raise Exception("Ollama service is not running. Please start Ollama with 'ollama serve'")
 
         if not self._check_model_availability("tinyllama"):
             raise Exception("Model 'tinyllama:1.1b' not found. Please run 'ollama pull tinyllama:1.1b'")
 
-        try:
-            system_prompt = f"""You are a helpful assistant that answers questions based on the provided context. 
-            Use the context to answer the user's question accurately. If the answer cannot be found in the context, say so.
+        system_prompt = f"""You are a helpful assistant that answers questions based on the provided context. 
+        Use the context to answer the user's question accurately. If the answer cannot be found in the context, say so.
+
+        Context:
+        {context}
+        """
 
-            Context:
-            {context}
-            """
+        user_message = messages[-1]["content"] if messages else ""
 
-            user_message = messages[-1]["content"] if messages else ""
+        return f"{system_prompt}\n\nUser Question: {user_message}"
 
-            full_prompt = f"{system_prompt}\n\nUser Question: {user_message}"
+    def chat_completion(self, messages: List[Dict], context: str = "") -> str:
+        full_prompt = self._build_prompt(messages, context)
 
-            response = requests.post(
+        try:
+            response = self.session.post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": "tinyllama:1.1b",
@@ -91,21 +158,100 @@ class OllamaClient:
         except Exception as e:
             raise Exception(f"Error in chat completion: {str(e)}")
 
+    def chat_completion_stream(self, messages: List[Dict], context: str = "") -> Iterator[str]:
+        """Yield response tokens as Ollama generates them"""
+        full_prompt = self._build_prompt(messages, context)
+
+        try:
+            with self.session.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": "tinyllama:1.1b",
+                    "prompt": full_prompt,
+                    "stream": True
+                },
+                stream=True,
+                timeout=60
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        except Exception as e:
+            raise Exception(f"Error in chat completion: {str(e)}")
+
+
+class LocalEmbedder:
+    """In-process sentence-transformers embedder, used instead of Ollama's
+    embedding endpoint when EMBEDDING_BACKEND=local"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise Exception("sentence-transformers is not installed. Please run 'pip install sentence-transformers'")
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer(model_name, device=device)
+        self.embed_batch_size = 64
+        # A single forward pass already uses the whole device
+        self.max_parallel_requests = 1
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.embed_batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+
+    def generate_embeddings(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
 
 class RAGService:
     def __init__(self, persist_directory: str = "./vector_db"):
         self.ollama_client = OllamaClient()
         self.persist_directory = persist_directory
 
+        # Embeddings come from Ollama by default; chat always goes through Ollama
+        if os.getenv("EMBEDDING_BACKEND", "ollama") == "local":
+            self.embedder = LocalEmbedder()
+            collection_name = "pdf_documents_local"
+        else:
+            self.embedder = self.ollama_client
+            collection_name = "pdf_documents"
+
         os.makedirs(persist_directory, exist_ok=True)
         self.chroma_client = chromadb.PersistentClient(path=persist_directory)
 
         try:
-            self.collection = self.chroma_client.get_collection(name="pdf_documents")
+            self.collection = self.chroma_client.get_collection(name=collection_name)
         except:
-            self.collection = self.chroma_client.create_collection(name="pdf_documents")
+            self.collection = self.chroma_client.create_collection(
+                name=collection_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+
+        self.index = FaissIndex()
+        self.index.build_from_collection(self.collection)
+        # Keeps Chroma writes and the matching index change together, so a rebuild
+        # after a delete cannot drop chunks added while it was running
+        self._write_lock = threading.Lock()
 
-        self.chat_sessions = {}
+        self.chat_sessions: Dict[str, deque] = {}
+
+        # Repeated questions skip the embedding round-trip
+        self._embed_query = lru_cache(maxsize=1024)(self._generate_query_embedding)
 
     def health_check(self) -> Dict[str, str]:
         status = {
@@ -129,71 +275,130 @@ class RAGService:
 
         return status
 
+    def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """Embed all documents, sending batches to the embedder concurrently"""
+        batch_size = self.embedder.embed_batch_size
+        batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+        if len(batches) <= 1:
+            return self.embedder.generate_embeddings_batch(documents) if documents else []
+
+        workers = min(len(batches), self.embedder.max_parallel_requests)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(self.embedder.generate_embeddings_batch, batches)
+            return [embedding for batch in results for embedding in batch]
+
+    @staticmethod
+    def _chunk_id(chunk: dict) -> str:
+        # The filename is part of the key so identical text in two files stays attributed to both
+        key = f"{chunk['metadata']['filename']}\0{chunk['content']}"
+        return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
     def add_documents(self, chunks: List[dict]) -> int:
+        if not chunks:
+            return 0
+
         try:
-            documents = []
-            metadatas = []
-            ids = []
-            embeddings = []
-
-            for i, chunk in enumerate(chunks):
-                # Generate embedding for each chunk
-                embedding = self.ollama_client.generate_embeddings(chunk['content'])
-
-                documents.append(chunk['content'])
-                metadatas.append(chunk['metadata'])
-                ids.append(f"{chunk['metadata']['filename']}_{chunk['metadata']['chunk_id']}_{i}")
-                embeddings.append(embedding)
-
-            self.collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            # Content-hash ids make re-uploads idempotent; repeats within a file are stored once
+            unique_chunks = {}
+            for chunk in chunks:
+                unique_chunks.setdefault(self._chunk_id(chunk), chunk)
+
+            # Chunks already stored under the same id need no new embedding
+            existing = set(self.collection.get(ids=list(unique_chunks), include=[])['ids'])
+            ids = [chunk_id for chunk_id in unique_chunks if chunk_id not in existing]
+            filenames = list({chunk['metadata']['filename'] for chunk in unique_chunks.values()})
+
+            documents = [unique_chunks[chunk_id]['content'] for chunk_id in ids]
+            metadatas = [unique_chunks[chunk_id]['metadata'] for chunk_id in ids]
+
+            if ids:
+                # Store unit vectors so every similarity is a plain dot product
+                embeddings = normalize_embeddings(self._embed_documents(documents))
+
+            with self._write_lock:
+                if ids:
+                    self.collection.upsert(
+                        embeddings=embeddings.tolist(),
+                        documents=documents,
+                        metadatas=metadatas,
+                        ids=ids
+                    )
 
-            return len(chunks)
+                # A re-uploaded file replaces its previous version, so drop chunks it no longer has
+                stored = self.collection.get(where={"filename": {"$in": filenames}}, include=[])['ids']
+                stale = [chunk_id for chunk_id in stored if chunk_id not in unique_chunks]
+                if stale:
+                    self.collection.delete(ids=stale)
+                    index = FaissIndex()
+                    index.build_from_collection(self.collection)
+                    self.index = index
+                elif ids:
+                    self.index.add(ids, embeddings, documents, metadatas)
+
+            return len(ids)
         except Exception as e:
             raise Exception(f"Error adding documents to vector DB: {str(e)}")
 
-    def similarity_search(self, query: str, k: int = 5) -> List[DocumentChunk]:
+    def delete_documents(self, filenames: List[str]) -> int:
+        if not filenames:
+            return 0
+
         try:
+            with self._write_lock:
+                ids = self.collection.get(where={"filename": {"$in": filenames}}, include=[])['ids']
+                if not ids:
+                    return 0
 
-            query_embedding = self.ollama_client.generate_embeddings(query)
+                self.collection.delete(ids=ids)
 
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k
-            )
+                # Rebuild the search index from what remains in the collection
+                index = FaissIndex()
+                index.build_from_collection(self.collection)
+                self.index = index
+
+            return len(ids)
+        except Exception as e:
+            raise Exception(f"Error deleting documents from vector DB: {str(e)}")
+
+    def _generate_query_embedding(self, query: str) -> tuple:
+        # Tuples keep cached entries immutable
+        return tuple(self.embedder.generate_embeddings(query))
+
+    def similarity_search(self, query: str, k: int = 5) -> List[DocumentChunk]:
+        try:
+
+            query_embedding = self._embed_query(query)
 
             chunks = []
-            if results['documents']:
-                for i in range(len(results['documents'][0])):
-                    chunk = DocumentChunk(
-                        content=results['documents'][0][i],
-                        metadata=results['metadatas'][0][i],
-                        similarity_score=1 - results['distances'][0][i] if results['distances'] else None
-                    )
-                    chunks.append(chunk)
+            for content, metadata, score in self.index.search(query_embedding, k):
+                chunks.append(DocumentChunk(
+                    content=content,
+                    metadata=metadata,
+                    similarity_score=score
+                ))
 
             return chunks
         except Exception as e:
             raise Exception(f"Error in similarity search: {str(e)}")
 
     def get_chat_history(self, session_id: str) -> List[Dict]:
-        return self.chat_sessions.get(session_id, [])
+        return list(self.chat_sessions.get(session_id, ()))
 
     def add_to_chat_history(self, session_id: str, role: str, content: str):
-        if session_id not in self.chat_sessions:
-            self.chat_sessions[session_id] = []
-
-        self.chat_sessions[session_id].append({
+        # Only the last 10 messages are kept per session
+        self.chat_sessions.setdefault(session_id, deque(maxlen=10)).append({
             "role": role,
             "content": content
         })
 
-        if len(self.chat_sessions[session_id]) > 10:
-            self.chat_sessions[session_id] = self.chat_sessions[session_id][-10:]
+    def _format_sources(self, chunks: List[DocumentChunk]) -> List[str]:
+        sources = []
+        for chunk in chunks:
+            source_info = f"File: {chunk.metadata.get('filename', 'Unknown')}"
+            if 'page' in chunk.metadata:
+                source_info += f", Page: {chunk.metadata['page']}"
+            sources.append(source_info)
+        return sources
 
     def chat_with_rag(self, message: str, session_id: str = "default") -> Dict[str, Any]:
         try:
@@ -201,28 +406,56 @@ class RAGService:
 
             context = "\n\n".join([chunk.content for chunk in relevant_chunks])
 
-            chat_history = self.get_chat_history(session_id)
-
             self.add_to_chat_history(session_id, "user", message)
 
             response = self.ollama_client.chat_completion(
-                messages=self.get_chat_history(session_id),
+                messages=self.chat_sessions[session_id],
                 context=context
             )
 
             self.add_to_chat_history(session_id, "assistant", response)
 
-            sources = []
-            for chunk in relevant_chunks:
-                source_info = f"File: {chunk.metadata.get('filename', 'Unknown')}"
-                if 'page' in chunk.metadata:
-                    source_info += f", Page: {chunk.metadata['page']}"
-                sources.append(source_info)
-
             return {
                 "response": response,
-                "sources": sources,
+                "sources": self._format_sources(relevant_chunks),
                 "session_id": session_id
             }
         except Exception as e:
-            raise Exception(f"Error in RAG chat: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error in RAG chat: {str(e)}")
+
+    def chat_with_rag_stream(self, message: str, session_id: str = "default") -> Iterator[str]:
+        """Stream a RAG answer as server-sent events.
+
+        Emits one "sources" event, then a "token" event per generated piece of
+        text and a final "done" event. Failures are reported as an "error"
+        event because the response status has already been sent.
+        """
+        def event(payload: Dict[str, Any]) -> str:
+            return f"data: {json.dumps(payload)}\n\n"
+
+        try:
+            relevant_chunks = self.similarity_search(message, k=3)
+
+            context = "\n\n".join([chunk.content for chunk in relevant_chunks])
+
+            yield event({
+                "type": "sources",
+                "sources": self._format_sources(relevant_chunks),
+                "session_id": session_id
+            })
+
+            self.add_to_chat_history(session_id, "user", message)
+
+            response_parts = []
+            for token in self.ollama_client.chat_completion_stream(
+                messages=self.chat_sessions[session_id],
+                context=context
+            ):
+                response_parts.append(token)
+                yield event({"type": "token", "content": token})
+
+            self.add_to_chat_history(session_id, "assistant", "".join(response_parts))
+
+            yield event({"type": "done"})
+        except Exception as e:
+            yield event({"type": "error", "message": f"Error in RAG chat: {str(e)}"})
@@ -1,9 +1,13 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt import MultipartEncoder
 import json
-from typing import List, Dict, Optional
+import orjson
+from typing import List, Dict, Iterator, Optional
 import time
-import uuid
+from uuid import uuid4
 import os
 import subprocess
 import threading
@@ -11,9 +15,17 @@ import sys
 from datetime import datetime
 import socket
 import atexit
+from collections import deque
+import functools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 API_BASE_URL = "http://127.0.0.1:8000"
-FASTAPI_PROCESS = None
+BACKEND_LOG_FILE = "backend.log"
+BACKEND_PID_FILE = os.path.join(tempfile.gettempdir(), "ragchat.pid")
+PID_FILE_STALE_SECONDS = 30
+# Messages kept in the UI; older ones fall off as new ones arrive
+CHAT_HISTORY_LIMIT = 200
 
 st.set_page_config(
     page_title="RAG PDF Chat System",
@@ -22,7 +34,7 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-st.markdown("""
+PAGE_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -32,30 +44,13 @@ st.markdown("""
         margin-bottom: 2rem;
         text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
     }
-    .chat-message {
-        padding: 1rem;
-        border-radius: 0.8rem;
-        margin: 0.8rem 0;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .user-message {
+    [data-testid="stChatMessage"]:has([data-testid="stChatMessageAvatarUser"]) {
         background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%);
         border-left: 4px solid #2196f3;
-        margin-left: 2rem;
     }
-    .assistant-message {
+    [data-testid="stChatMessage"]:has([data-testid="stChatMessageAvatarAssistant"]) {
         background: linear-gradient(135deg, #f1f8e9 0%, #dcedc8 100%);
         border-left: 4px solid #4caf50;
-        margin-right: 2rem;
-    }
-    .source-info {
-        font-size: 0.8rem;
-        color: #666;
-        font-style: italic;
-        margin-top: 0.5rem;
-        padding: 0.3rem;
-        background-color: rgba(255,255,255,0.7);
-        border-radius: 0.3rem;
     }
     .status-healthy {
         color: #4caf50;
@@ -81,63 +76,166 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
+# Streamlit clears the page on every rerun, so the styles are re-sent each run
+st.markdown(PAGE_CSS, unsafe_allow_html=True)
 
-def is_port_in_use(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+
+def _probe_port(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM, proto=0) as s:
+        s.settimeout(0.1)
         return s.connect_ex(('localhost', port)) == 0
 
 
+@functools.lru_cache(maxsize=4)
+def _port_cached(port: int, bucket: int) -> bool:
+    return _probe_port(port)
+
+
+def is_port_in_use(port):
+    # Repeated checks within the same ~500ms window share one probe
+    return _port_cached(port, int(time.monotonic() * 2))
+
+
+@st.cache_resource
+def get_server_state() -> Dict:
+    # Cached so the spawned process and its lock survive Streamlit reruns
+    state = {"process": None, "lock": threading.Lock()}
+    atexit.register(stop_fastapi_server, state)
+    return state
+
+
+def _claim_pid_file() -> bool:
+    """Create the pid file exclusively so only one Streamlit process spawns the backend"""
+    for _ in range(2):
+        try:
+            os.close(os.open(BACKEND_PID_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            # A pid file left by a spawn that died is cleared once it is old and nothing listens
+            try:
+                age = time.time() - os.path.getmtime(BACKEND_PID_FILE)
+            except OSError:
+                continue
+            if age < PID_FILE_STALE_SECONDS or is_port_in_use(8000):
+                return False
+            try:
+                os.remove(BACKEND_PID_FILE)
+            except OSError:
+                return False
+    return False
+
+
+def _release_pid_file():
+    try:
+        os.remove(BACKEND_PID_FILE)
+    except OSError:
+        pass
+
+
 def start_fastapi_server():
-    global FASTAPI_PROCESS
-    if FASTAPI_PROCESS is None or FASTAPI_PROCESS.poll() is not None:
+    state = get_server_state()
+    with state["lock"]:
+        process = state["process"]
+        if process is not None:
+            if process.poll() is None:
+                return True
+            # Our earlier spawn exited (e.g. crashed on startup); the pid file is ours to drop
+            state["process"] = None
+            _release_pid_file()
+
         try:
             if os.path.exists("fastAPI.py"):
-                FASTAPI_PROCESS = subprocess.Popen([
-                    sys.executable, "fastAPI.py"
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                return True
+                command = [sys.executable, "fastAPI.py"]
             elif os.path.exists("main.py"):
-                FASTAPI_PROCESS = subprocess.Popen([
-                    sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                return True
+                command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"]
             else:
                 return False
+
+            if not _claim_pid_file():
+                # Another process is already starting the backend; the readiness loop waits for it
+                return True
+
+            # Log to a file: an unread PIPE fills up and blocks the server once it logs ~64KB
+            with open(BACKEND_LOG_FILE, "ab") as log_file:
+                state["process"] = subprocess.Popen(
+                    command,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+            with open(BACKEND_PID_FILE, "w") as pid_file:
+                pid_file.write(str(state["process"].pid))
+            return True
         except Exception as e:
+            _release_pid_file()
             st.error(f"Failed to start server: {e}")
             return False
-    return True
-
-
-def stop_fastapi_server():
-    global FASTAPI_PROCESS
-    if FASTAPI_PROCESS and FASTAPI_PROCESS.poll() is None:
-        FASTAPI_PROCESS.terminate()
-        FASTAPI_PROCESS.wait()
 
 
-atexit.register(stop_fastapi_server)
+def stop_fastapi_server(state: Dict = None):
+    state = state or get_server_state()
+    with state["lock"]:
+        process = state["process"]
+        if process is None:
+            return
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+        state["process"] = None
+        _release_pid_file()
 
 
 class RAGChatAPI:
     def __init__(self, base_url: str):
         self.base_url = base_url
 
+        # One keep-alive session for every backend call
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Connection": "keep-alive",
+            "Accept": "application/json"
+        })
+        # Connection failures are retried for every call; 5xx responses only for
+        # idempotent GET/DELETE, so chat and upload are never sent twice
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            pool_block=False,
+            max_retries=Retry(
+                total=3,
+                connect=3,
+                read=0,
+                backoff_factor=0.1,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(["GET", "DELETE"])
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        atexit.register(self.session.close)
+
     def check_health(self) -> Dict:
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=5)
-            return response.json()
+            response = self.session.get(f"{self.base_url}/health", timeout=5)
+            return orjson.loads(response.content)
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
     def upload_pdf(self, file) -> Dict:
         try:
-            files = {"file": (file.name, file.getvalue(), "application/pdf")}
-            response = requests.post(f"{self.base_url}/upload", files=files, timeout=120)
+            # Stream the upload from the file object instead of copying it into the request body
+            file.seek(0)
+            encoder = MultipartEncoder(fields={"file": (file.name, file, "application/pdf")})
+            response = self.session.post(
+                f"{self.base_url}/upload",
+                data=encoder,
+                headers={"Content-Type": encoder.content_type},
+                timeout=120
+            )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except requests.exceptions.Timeout:
             return {"error": "Upload timeout - file may be too large"}
         except requests.exceptions.RequestException as e:
@@ -151,9 +249,14 @@ class RAGChatAPI:
                 "message": message,
                 "session_id": session_id
             }
-            response = requests.post(f"{self.base_url}/chat", json=payload, timeout=60)
+            response = self.session.post(
+                f"{self.base_url}/chat",
+                data=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=60
+            )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except requests.exceptions.Timeout:
             return {"error": "Chat request timeout"}
         except requests.exceptions.RequestException as e:
@@ -161,46 +264,130 @@ class RAGChatAPI:
         except Exception as e:
             return {"error": f"Unexpected error: {str(e)}"}
 
+    def chat_with_rag_stream(self, message: str, session_id: str) -> Iterator[Dict]:
+        """Yield the server-sent events of /chat/stream as they arrive"""
+        try:
+            payload = {
+                "message": message,
+                "session_id": session_id
+            }
+            with self.session.post(
+                f"{self.base_url}/chat/stream",
+                data=orjson.dumps(payload),
+                headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+                stream=True,
+                timeout=60
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line.startswith(b"data: "):
+                        yield orjson.loads(line[len(b"data: "):])
+        except requests.exceptions.Timeout:
+            yield {"type": "error", "message": "Chat request timeout"}
+        except requests.exceptions.RequestException as e:
+            yield {"type": "error", "message": f"Chat failed: {str(e)}"}
+        except Exception as e:
+            yield {"type": "error", "message": f"Unexpected error: {str(e)}"}
+
     def get_documents(self) -> Dict:
         try:
-            response = requests.get(f"{self.base_url}/documents", timeout=10)
+            response = self.session.get(f"{self.base_url}/documents", timeout=10)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
     def get_chat_history(self, session_id: str) -> Dict:
         try:
-            response = requests.get(f"{self.base_url}/sessions/{session_id}/history", timeout=10)
+            response = self.session.get(f"{self.base_url}/sessions/{session_id}/history", timeout=10)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
     def clear_chat_history(self, session_id: str) -> Dict:
         try:
-            response = requests.delete(f"{self.base_url}/sessions/{session_id}", timeout=10)
+            response = self.session.delete(f"{self.base_url}/sessions/{session_id}", timeout=10)
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
     def delete_document(self, filename: str) -> Dict:
+        return self.delete_documents([filename])
+
+    def delete_documents(self, filenames: List[str]) -> Dict:
         try:
-            response = requests.delete(f"{self.base_url}/documents/{filename}", timeout=10)
+            response = self.session.post(
+                f"{self.base_url}/documents/delete",
+                data=orjson.dumps({"filenames": filenames}),
+                headers={"Content-Type": "application/json"},
+                timeout=30
+            )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
         except Exception as e:
             return {"error": str(e)}
 
 
-api = RAGChatAPI(API_BASE_URL)
+@st.cache_resource
+def get_api() -> RAGChatAPI:
+    # Cached so the pooled session survives Streamlit reruns
+    return RAGChatAPI(API_BASE_URL)
+
+
+api = get_api()
+
+
+@st.cache_resource
+def get_request_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4)
+
+
+class BackendCallFailed(Exception):
+    """Carries a failed API result out of a cached function so it is not cached"""
+
+    def __init__(self, result: Dict):
+        super().__init__(result)
+        self.result = result
+
+
+# Every widget interaction reruns the script, so these rarely-changing calls are
+# cached briefly; clear them when the data is known to have changed
+@st.cache_data(ttl=5, show_spinner=False)
+def check_health_cached() -> Dict:
+    result = api.check_health()
+    if result.get("status") == "error":
+        raise BackendCallFailed(result)
+    return result
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_documents_cached() -> Dict:
+    result = api.get_documents()
+    if "error" in result:
+        raise BackendCallFailed(result)
+    return result
+
+
+def fetch_health() -> Dict:
+    try:
+        return check_health_cached()
+    except BackendCallFailed as e:
+        return e.result
+
+
+def fetch_documents() -> Dict:
+    try:
+        return get_documents_cached()
+    except BackendCallFailed as e:
+        return e.result
 
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    st.session_state.session_id = str(uuid4())
 
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
 
 if "server_started" not in st.session_state:
     st.session_state.server_started = False
@@ -208,36 +395,30 @@ if "server_started" not in st.session_state:
 if "startup_attempted" not in st.session_state:
     st.session_state.startup_attempted = False
 
+if "notices" not in st.session_state:
+    st.session_state.notices = {}
+
+
+def queue_notice(key: str, level: str, message: str):
+    """Keep a status message across st.rerun() so it can be shown on the next run"""
+    st.session_state.notices.setdefault(key, []).append((level, message))
+
+
+def show_notices(key: str):
+    """Show the messages queued under key once, then forget them"""
+    for level, message in st.session_state.notices.pop(key, []):
+        getattr(st, level)(message)
+
 
 def display_chat_message(role: str, content: str, sources: List[str] = None, timestamp: str = None):
-    timestamp_str = ""
-    if timestamp:
-        timestamp_str = f"<small style='color: #999; float: right;'>{timestamp}</small>"
-
-    if role == "user":
-        st.markdown(f"""
-        <div class="chat-message user-message">
-            <strong>👤 You:</strong> {timestamp_str}
-            <div style="clear: both; margin-top: 0.5rem;">{content}</div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        source_text = ""
-        if sources and len(sources) > 0:
-            source_links = []
-            for source in sources:
-                if source.strip():
-                    source_links.append(f"📄 {source}")
-            if source_links:
-                source_text = f"<div class='source-info'>📚 Sources: {' | '.join(source_links)}</div>"
-
-        st.markdown(f"""
-        <div class="chat-message assistant-message">
-            <strong>🤖 Assistant:</strong> {timestamp_str}
-            <div style="clear: both; margin-top: 0.5rem;">{content}</div>
-            {source_text}
-        </div>
-        """, unsafe_allow_html=True)
+    with st.chat_message(role):
+        st.markdown(content)
+
+        source_links = [f"📄 {source}" for source in sources or [] if source.strip()]
+        if source_links:
+            st.caption(f"📚 Sources: {' | '.join(source_links)}")
+        if timestamp:
+            st.caption(timestamp)
 
 
 def check_and_start_server():
@@ -269,13 +450,11 @@ def main():
         with status_placeholder.container():
             st.info("🔍 Checking for existing server...")
             progress_bar.progress(25)
-            time.sleep(1)
 
             if is_port_in_use(8000):
-                st.success("✅ Found running server!")
+                queue_notice("startup", "success", "✅ Found running server!")
                 st.session_state.server_started = True
                 progress_bar.progress(100)
-                time.sleep(1)
                 st.rerun()
             else:
                 st.info("🚀 Starting FastAPI server...")
@@ -285,16 +464,26 @@ def main():
                     st.info("⏳ Waiting for server to initialize...")
                     progress_bar.progress(75)
 
-                    for i in range(10):
-                        time.sleep(2)
-                        if is_port_in_use(8000):
-                            st.success("✅ Server started successfully!")
+                    # Probe quickly at first, then back off to at most once a second
+                    delay = 0.1
+                    started = time.monotonic()
+                    deadline = started + 20
+                    while time.monotonic() < deadline:
+                        # Probe directly so a cached "not yet" does not delay the first success
+                        if _probe_port(8000):
+                            # Readiness check that also warms the pooled connection
+                            try:
+                                api.session.get(f"{api.base_url}/health", timeout=0.5)
+                            except requests.exceptions.RequestException:
+                                pass
+                            queue_notice("startup", "success", "✅ Server started successfully!")
                             st.session_state.server_started = True
                             progress_bar.progress(100)
-                            time.sleep(1)
                             st.rerun()
                             return
-                        progress_bar.progress(75 + (i * 2))
+                        time.sleep(delay)
+                        delay = min(delay * 1.5, 1.0)
+                        progress_bar.progress(75 + int(20 * (time.monotonic() - started) / (deadline - started)))
 
                     st.error("❌ Server failed to start in time")
                     progress_bar.progress(100)
@@ -332,20 +521,34 @@ def main():
 
             return
 
-    health_status = api.check_health()
+    show_notices("startup")
+
+    # Health and document list are independent, so fetch them concurrently
+    pool = get_request_pool()
+    health_future = pool.submit(fetch_health)
+    docs_future = pool.submit(fetch_documents)
+
+    health_status = health_future.result()
+    status = health_status.get("status")
+    ollama_status = health_status.get("ollama", "unknown")
+    vector_db_status = health_status.get("vector_db", "unknown")
 
-    if health_status.get("status") == "error":
+    if status == "error":
         st.error("❌ Backend server not responding!")
 
         col1, col2 = st.columns(2)
         with col1:
             if st.button("🔄 Retry Connection"):
+                check_health_cached.clear()
+                get_documents_cached.clear()
                 st.rerun()
         with col2:
             if st.button("🚀 Restart Server"):
                 st.session_state.server_started = False
                 st.session_state.startup_attempted = False
                 stop_fastapi_server()
+                check_health_cached.clear()
+                get_documents_cached.clear()
                 st.rerun()
 
         return
@@ -353,28 +556,26 @@ def main():
     with st.sidebar:
         st.header("🔧 System Status")
 
-        if health_status.get("status") == "healthy":
-            st.markdown('<div class="metric-card"><p class="status-healthy">✅ System Operational</p></div>',
-                        unsafe_allow_html=True)
+        match status:
+            case "healthy":
+                st.markdown('<div class="metric-card"><p class="status-healthy">✅ System Operational</p></div>',
+                            unsafe_allow_html=True)
 
-            ollama_status = health_status.get("ollama", "unknown")
-            vector_db_status = health_status.get("vector_db", "unknown")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                if ollama_status == "connected":
-                    st.markdown("🟢 **Ollama**<br>Connected", unsafe_allow_html=True)
-                else:
-                    st.markdown("🔴 **Ollama**<br>Disconnected", unsafe_allow_html=True)
+                col1, col2 = st.columns(2)
+                with col1:
+                    if ollama_status == "connected":
+                        st.markdown("🟢 **Ollama**<br>Connected", unsafe_allow_html=True)
+                    else:
+                        st.markdown("🔴 **Ollama**<br>Disconnected", unsafe_allow_html=True)
 
-            with col2:
-                st.markdown(f"🟢 **Vector DB**<br>{vector_db_status.title()}", unsafe_allow_html=True)
+                with col2:
+                    st.markdown(f"🟢 **Vector DB**<br>{vector_db_status.title()}", unsafe_allow_html=True)
 
-            if ollama_status != "connected":
-                st.warning("⚠️ Start Ollama: `ollama serve`")
-        else:
-            st.markdown('<div class="metric-card"><p class="status-unhealthy">❌ System Issues</p></div>',
-                        unsafe_allow_html=True)
+                if ollama_status != "connected":
+                    st.warning("⚠️ Start Ollama: `ollama serve`")
+            case _:
+                st.markdown('<div class="metric-card"><p class="status-unhealthy">❌ System Issues</p></div>',
+                            unsafe_allow_html=True)
 
         st.divider()
 
@@ -395,28 +596,30 @@ def main():
                     if "error" in result:
                         st.error(f"Upload failed: {result['error']}")
                     else:
-                        st.success(f"✅ {result.get('message', 'Success!')}")
+                        queue_notice("upload", "success", f"✅ {result.get('message', 'Success!')}")
                         if 'chunks_created' in result:
-                            st.info(f"📊 Created {result['chunks_created']} chunks")
-                        time.sleep(1)
+                            queue_notice("upload", "info", f"📊 Created {result['chunks_created']} chunks")
+                        get_documents_cached.clear()
                         st.rerun()
+        show_notices("upload")
 
         st.subheader("📚 Uploaded Documents")
-        docs_result = api.get_documents()
+        show_notices("delete")
+        docs_result = docs_future.result()
 
         if "error" not in docs_result and docs_result.get("documents"):
-            for i, doc in enumerate(docs_result["documents"]):
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    st.write(f"📄 {doc}")
-                with col2:
-                    if st.button("🗑️", key=f"delete_{i}", help=f"Delete {doc}"):
-                        delete_result = api.delete_document(doc)
-                        if "error" not in delete_result:
-                            st.success("Deleted!")
-                            st.rerun()
-                        else:
-                            st.error("Delete failed")
+            documents = docs_result["documents"]
+            st.markdown("\n".join(f"- 📄 {doc}" for doc in documents))
+
+            to_delete = st.multiselect("Select documents to delete", documents, key="delete_select")
+            if st.button("🗑️ Delete selected", key="delete_btn", disabled=not to_delete):
+                delete_result = api.delete_documents(to_delete)
+                if "error" not in delete_result:
+                    queue_notice("delete", "success", "Deleted!")
+                    get_documents_cached.clear()
+                    st.rerun()
+                else:
+                    st.error("Delete failed")
         else:
             st.info("No documents uploaded")
 
@@ -429,13 +632,13 @@ def main():
         with col1:
             if st.button("🗑️ Clear", key="clear_btn"):
                 api.clear_chat_history(st.session_state.session_id)
-                st.session_state.chat_history = []
+                st.session_state.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
                 st.rerun()
 
         with col2:
             if st.button("🆕 New", key="new_session_btn"):
-                st.session_state.session_id = str(uuid.uuid4())
-                st.session_state.chat_history = []
+                st.session_state.session_id = str(uuid4())
+                st.session_state.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
                 st.rerun()
 
     st.header("💭 Chat Interface")
@@ -477,31 +680,44 @@ def main():
             if not docs_result.get("documents"):
                 st.warning("⚠️ Upload a PDF first!")
             else:
+                now = datetime.now
                 user_message = {
                     "role": "user",
                     "content": user_input,
-                    "timestamp": datetime.now().strftime("%H:%M")
+                    "timestamp": now().strftime("%H:%M")
                 }
                 st.session_state.chat_history.append(user_message)
 
-                with st.spinner("🤔 Thinking..."):
-                    response = api.chat_with_rag(user_input, st.session_state.session_id)
-
-                    if "error" in response:
-                        error_message = {
-                            "role": "assistant",
-                            "content": f"❌ Error: {response['error']}",
-                            "timestamp": datetime.now().strftime("%H:%M")
-                        }
-                        st.session_state.chat_history.append(error_message)
-                    else:
-                        assistant_message = {
-                            "role": "assistant",
-                            "content": response.get("response", "No response"),
-                            "sources": response.get("sources", []),
-                            "timestamp": datetime.now().strftime("%H:%M")
-                        }
-                        st.session_state.chat_history.append(assistant_message)
+                stream_state = {"sources": [], "error": None}
+
+                def stream_tokens():
+                    for event in api.chat_with_rag_stream(user_input, st.session_state.session_id):
+                        if event.get("type") == "token":
+                            yield event["content"]
+                        elif event.get("type") == "sources":
+                            stream_state["sources"] = event.get("sources", [])
+                        elif event.get("type") == "error":
+                            stream_state["error"] = event.get("message", "Unknown error")
+
+                # Show the answer token by token while it is generated
+                with chat_container:
+                    display_chat_message("user", user_input, timestamp=user_message["timestamp"])
+                    with st.chat_message("assistant"):
+                        response_text = st.write_stream(stream_tokens())
+
+                if stream_state["error"]:
+                    st.session_state.chat_history.append({
+                        "role": "assistant",
+                        "content": f"❌ Error: {stream_state['error']}",
+                        "timestamp": now().strftime("%H:%M")
+                    })
+                else:
+                    st.session_state.chat_history.append({
+                        "role": "assistant",
+                        "content": response_text if isinstance(response_text, str) and response_text else "No response",
+                        "sources": stream_state["sources"],
+                        "timestamp": now().strftime("%H:%M")
+                    })
 
                 st.rerun()
 
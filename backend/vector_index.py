@@ -0,0 +1,92 @@
+import faiss
+import numpy as np
+import threading
+from typing import List, Dict, Tuple
+
+
+def normalize_embeddings(vectors) -> np.ndarray:
+    """Scale each row to unit length so inner product equals cosine similarity"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class FaissIndex:
+    """In-memory inner-product index mirroring the Chroma collection"""
+
+    def __init__(self, quantize: bool = True):
+        # int8 codes take a quarter of the memory of float32 vectors
+        self.quantize = quantize
+        self.index = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        """Add chunks, refreshing the metadata of ids that are already indexed"""
+        if not len(ids):
+            return
+
+        vectors = normalize_embeddings(embeddings)
+        with self._lock:
+            new_rows = []
+            for row, chunk_id in enumerate(ids):
+                position = self._positions.get(chunk_id)
+                if position is None:
+                    new_rows.append(row)
+                else:
+                    # Ids are content hashes, so the stored vector is unchanged
+                    self.documents[position] = documents[row]
+                    self.metadatas[position] = metadatas[row]
+
+            if not new_rows:
+                return
+
+            if self.index is None:
+                self.index = self._create_index(vectors.shape[1])
+            self.index.add(vectors[new_rows])
+            for row in new_rows:
+                self._positions[ids[row]] = len(self.ids)
+                self.ids.append(ids[row])
+                self.documents.append(documents[row])
+                self.metadatas.append(metadatas[row])
+
+    def _create_index(self, dimension: int):
+        if not self.quantize:
+            return faiss.IndexFlatIP(dimension)
+
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT
+        )
+        # Unit vectors lie in [-1, 1], so train on those bounds for fixed symmetric int8 steps
+        bounds = np.vstack([
+            np.full(dimension, -1.0, dtype=np.float32),
+            np.full(dimension, 1.0, dtype=np.float32)
+        ])
+        index.train(bounds)
+        return index
+
+    def build_from_collection(self, collection):
+        """Load every stored embedding from a Chroma collection"""
+        results = collection.get(include=["embeddings", "documents", "metadatas"])
+        self.add(results["ids"], results["embeddings"], results["documents"], results["metadatas"])
+
+    def search(self, query_embedding, k: int) -> List[Tuple[str, Dict, float]]:
+        """Return (document, metadata, cosine similarity) for the k nearest chunks"""
+        query = normalize_embeddings(query_embedding)
+        with self._lock:
+            if self.index is None or not self.ids:
+                return []
+            scores, positions = self.index.search(query, min(k, len(self.ids)))
+
+        return [
+            (self.documents[position], self.metadatas[position], float(score))
+            for score, position in zip(scores[0], positions[0])
+            if position != -1
+        ]